@@ -5,159 +5,165 @@ Simple MCP server using the working code from main.py
 """
 
 import os
-import re
 import time
-import requests
+import asyncio
+import functools
 import threading
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup, Tag
-import zipfile
+from dataclasses import dataclass
+from urllib.parse import urljoin
+from collections import OrderedDict
+import logging
 from fastmcp import FastMCP
 
+from threegpp_common import (
+    parse_spec_number,
+    rel_to_zip_suffix,
+    fetch_listing_hrefs,
+    find_spec_zip_link,
+    probe_series,
+    LOOKUP_TTL,
+    DownloadProgress,
+    local_zip_path,
+    zip_lock,
+    download_zip,
+    extract_documents,
+)
+
+log = logging.getLogger(__name__)
+
 # Create FastMCP server instance
 mcp = FastMCP("3gpp-document-downloader")
 
+# At most this many background downloads run at once; the rest wait as "queued"
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_SLOTS = threading.BoundedSemaphore(DOWNLOAD_WORKERS)
 
-def parse_spec_number(spec: str):
-    m = re.match(r"(TS|TR|GS|GR)\s*(\d{2})\.(\d{3})(?:-(\d+))?", spec.upper())
-    if not m:
-        raise ValueError("Invalid spec format. Example: TS 24.301, TR 38.101-1")
-    spec_type, series, number, sub = m.groups()
-    return series, number, sub or "1"
 
+@dataclass
+class TaskState:
+    """Mutable state of one background download, updated in place by its worker"""
 
-def rel_to_zip_suffix(rel: str):
-    # Convert release number to base-36 (e.g., Rel-18 → i)
-    m = re.match(r"Rel-(\d+)", rel, re.I)
-    if not m:
-        raise ValueError("Invalid release format. Example: Rel-18")
+    status: str
+    progress: str
+    files: list = None
+    output_dir: str = None
+    zip_file: str = None
 
-    rel_num = int(m.group(1))
-    # Base-36: 0-9 as is, 10-35 as a-z
-    if rel_num < 10:
-        return f"{rel_num}00"  # Example: Rel-8 → 800
-    elif rel_num < 36:
-        return f"{chr(ord('a') + rel_num - 10)}00"  # Example: Rel-18 → i00
-    else:
-        raise ValueError(f"Unsupported release number: {rel_num}")
 
+class TaskProgress(DownloadProgress):
+    """DownloadProgress that records its messages on a background task"""
 
-def find_spec_zip_link(series, number, rel_suffix):
-    base_url = f"https://www.3gpp.org/ftp/Specs/archive/{series}_series/"
-    doc_dir = f"{series}.{number}"
-    doc_url = urljoin(base_url, doc_dir + "/")
-
-    # Search URL and release suffix info
-
-    r = requests.get(doc_url)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.content, "html.parser")
-
-    # Find ZIP files starting with the release suffix
-    candidates = []
-    for a in soup.find_all("a", href=True):
-        if isinstance(a, Tag):
-            href = a.get("href")
-            if isinstance(href, str) and href.endswith(".zip"):
-                # Extract version code from filename (e.g., 38331-i60.zip → i60)
-                filename = os.path.basename(href)
-                if filename.startswith(f"{series}{number}-") and filename.endswith(
-                    ".zip"
-                ):
-                    version_code = filename[
-                        len(f"{series}{number}-") : -4
-                    ]  # remove .zip
-                    if version_code.startswith(
-                        rel_suffix[:1]
-                    ):  # first char matches release
-                        candidates.append(href)
-
-    if not candidates:
-        # No ZIP file found starting with release
-        return None
+    def __init__(self, task):
+        self.task = task
+        super().__init__()
 
-    # Select the latest version (largest base-36 value)
-    def extract_version(href):
-        filename = os.path.basename(href)
-        version_code = filename[len(f"{series}{number}-") : -4]
-        try:
-            return int(version_code, 36)
-        except ValueError:
-            return 0
+    def report(self, message):
+        with tasks_lock:
+            self.task.progress = message
 
-    latest = max(candidates, key=extract_version)
-    return urljoin(doc_url, latest)
 
-
-def download_and_extract(zip_url, output_dir, task_id):
+def run_download_task(zip_url, output_dir, task_id, keep_zip=False):
     """Background download and extract function"""
-    try:
-        background_tasks[task_id] = {
-            "status": "running",
-            "progress": "Starting download...",
-        }
-
-        # Create output directory
-        os.makedirs(output_dir, exist_ok=True)
-        local_zip = os.path.join(output_dir, os.path.basename(urlparse(zip_url).path))
-
-        # Download ZIP file
-        background_tasks[task_id]["progress"] = f"Downloading ZIP file: {zip_url}"
-        with requests.get(zip_url, stream=True, timeout=600) as r:
-            r.raise_for_status()
-            total_size = int(r.headers.get("content-length", 0))
-            downloaded_size = 0
-
-            with open(local_zip, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_size += len(chunk)
-
-                        # Update progress every 10%
-                        if total_size > 0:
-                            progress = (downloaded_size / total_size) * 100
-                            if int(progress) % 10 == 0:
-                                background_tasks[task_id][
-                                    "progress"
-                                ] = f"Download progress: {progress:.1f}% ({downloaded_size / (1024*1024):.1f} MB / {total_size / (1024*1024):.1f} MB)"
-
-        # Extract files
-        background_tasks[task_id]["progress"] = "Extracting PDF/DOC/DOCX files..."
-        extracted_files = []
-        with zipfile.ZipFile(local_zip, "r") as z:
-            file_list = [
-                name
-                for name in z.namelist()
-                if name.lower().endswith((".pdf", ".doc", ".docx"))
-            ]
-            for name in file_list:
-                z.extract(name, output_dir)
-                extracted_files.append(name)
-
-        # Mark as completed
-        background_tasks[task_id] = {
-            "status": "completed",
-            "progress": "Download and extraction completed successfully",
-            "files": extracted_files,
-            "output_dir": output_dir,
-            "zip_file": local_zip,
-        }
-
-    except Exception as e:
-        background_tasks[task_id] = {
-            "status": "error",
-            "progress": f"Error: {str(e)}",
-        }
+    # Daemon thread waits here (status "queued") until a download slot frees up
+    with DOWNLOAD_SLOTS:
+        with tasks_lock:
+            task = background_tasks[task_id]
+            task.status = "running"
+            task.progress = f"Downloading ZIP file: {zip_url}"
 
-
-# Global download state
-download_state = {}
-background_tasks = {}
+        try:
+            # Another task writing the same ZIP finishes (or fails) before this one starts
+            with zip_lock(local_zip_path(zip_url, output_dir)):
+                # Download ZIP file
+                log.info("Task %s: downloading %s", task_id, zip_url)
+                local_zip = download_zip(zip_url, output_dir, TaskProgress(task))
+
+                # Extract files
+                with tasks_lock:
+                    task.progress = "Extracting PDF/DOC/DOCX files..."
+                extracted_files = extract_documents(local_zip, output_dir)
+                if not keep_zip:
+                    os.remove(local_zip)
+
+            # Mark as completed
+            with tasks_lock:
+                task.status = "completed"
+                task.progress = "Download and extraction completed successfully"
+                task.files = extracted_files
+                task.output_dir = output_dir
+                task.zip_file = local_zip if keep_zip else None
+            log.info("Task %s: extracted %d files", task_id, len(extracted_files))
+
+        except Exception as e:
+            log.warning("Task %s failed: %s", task_id, e)
+            with tasks_lock:
+                task.status = "error"
+                task.progress = f"Error: {str(e)}"
+
+
+class ExpiringLRU:
+    """Bounded mapping that evicts least recently used entries and expires old ones"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (stored_at, value)
+        self.lock = threading.RLock()
+
+    def _expired(self, stored_at):
+        return time.monotonic() - stored_at > self.ttl
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, key):
+        with self.lock:
+            stored_at, value = self.data[key]
+            if self._expired(stored_at):
+                del self.data[key]
+                raise KeyError(key)
+            self.data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic(), value)
+            self.data.move_to_end(key)
+
+            # Drop expired entries from the cold end, then enforce the size bound
+            while self.data and self._expired(next(iter(self.data.values()))[0]):
+                self.data.popitem(last=False)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.data[key]
+
+    def pop(self, key, default=None):
+        """Remove key and return its value, or default if it is missing or expired"""
+        with self.lock:
+            stored_at, value = self.data.pop(key, (None, default))
+            if stored_at is None or self._expired(stored_at):
+                return default
+            return value
+
+    def __len__(self):
+        return len(self.data)
+
+
+# Global download state (link checks expire after an hour if never downloaded)
+download_state = ExpiringLRU(maxsize=1024, ttl=3600)
+background_tasks = {}  # task_id -> TaskState
+tasks_lock = threading.RLock()
 
 
 @mcp.tool()
-def check_3gpp_link(spec: str, release: str) -> str:
+async def check_3gpp_link(spec: str, release: str) -> str:
     """
     Check if a 3GPP specification and release combination exists and get the download link.
 
@@ -173,8 +179,10 @@ def check_3gpp_link(spec: str, release: str) -> str:
         series, number, _ = parse_spec_number(spec)
         rel_suffix = rel_to_zip_suffix(release)
 
-        # Find ZIP link
-        zip_link = find_spec_zip_link(series, number, rel_suffix)
+        # Find ZIP link (blocking HTTP runs on a worker thread, not the event loop)
+        zip_link = await asyncio.to_thread(
+            find_spec_zip_link, series, number, rel_suffix
+        )
 
         if not zip_link:
             return f"❌ Could not find ZIP file for {spec} release {release}. This spec-release combination may not exist in the 3GPP archive."
@@ -204,7 +212,9 @@ def check_3gpp_link(spec: str, release: str) -> str:
 
 
 @mcp.tool()
-def download_3gpp_document(download_id: str, output_dir: str = "./downloads") -> str:
+def download_3gpp_document(
+    download_id: str, output_dir: str = "./downloads", keep_zip: bool = False
+) -> str:
     """
     Download and extract a 3GPP specification document using a download ID from check_3gpp_link.
     This will start the download in the background and return immediately.
@@ -212,30 +222,33 @@ def download_3gpp_document(download_id: str, output_dir: str = "./downloads") ->
     Args:
         download_id (str): Download ID from check_3gpp_link.
         output_dir (str, optional): Directory to save the extracted files. Defaults to "./downloads".
+        keep_zip (bool, optional): Keep the downloaded ZIP next to the extracted files. Defaults to False.
 
     Returns:
         str: Task ID for checking download status.
     """
     try:
-        if download_id not in download_state:
+        # A single lookup that also consumes the ID, so it can't expire in between
+        info = download_state.pop(download_id)
+        if info is None:
             return f"❌ Invalid download ID: {download_id}. Please run check_3gpp_link first."
 
-        info = download_state[download_id]
         zip_link = info["zip_link"]
 
         # Generate task ID
         task_id = f"task_{download_id}_{int(time.time())}"
 
-        # Start background download
+        # Queue background download (daemon, so it never blocks server shutdown)
+        with tasks_lock:
+            background_tasks[task_id] = TaskState(
+                "queued", "Waiting for a free download slot..."
+            )
         thread = threading.Thread(
-            target=download_and_extract, args=(zip_link, output_dir, task_id)
+            target=run_download_task, args=(zip_link, output_dir, task_id, keep_zip)
         )
         thread.daemon = True
         thread.start()
 
-        # Clean up download state
-        del download_state[download_id]
-
         return (
             f"Download request completed. It will take several minutes to complete.\n\n"
             f"Spec: {info['spec']}\n"
@@ -247,10 +260,6 @@ def download_3gpp_document(download_id: str, output_dir: str = "./downloads") ->
 
     except Exception as e:
         return f"❌ Failed to start download: {str(e)}"
-    finally:
-        # Clean up download state even if there was an error
-        if download_id in download_state:
-            del download_state[download_id]
 
 
 @mcp.tool()
@@ -264,21 +273,22 @@ def check_download_status(task_id: str) -> str:
     Returns:
         str: Current status and progress of the download task.
     """
-    if task_id not in background_tasks:
-        return f"❌ Task ID not found: {task_id}"
-
-    task = background_tasks[task_id]
-    status = task["status"]
-    progress = task["progress"]
-
-    if status == "running":
+    with tasks_lock:
+        task = background_tasks.get(task_id)
+        if task is None:
+            return f"❌ Task ID not found: {task_id}"
+        status, progress = task.status, task.progress
+        files, output_dir = task.files or [], task.output_dir
+
+    if status == "queued":
+        return f"Download queued...\n\nStatus: {progress}"
+    elif status == "running":
         return f"Download in progress...\n\nStatus: {progress}"
     elif status == "completed":
-        files = task.get("files", [])
         files_info = "\n".join([f"  - {f}" for f in files])
         return (
             f"Download completed!\n\n"
-            f"Output directory: {task['output_dir']}\n"
+            f"Output directory: {output_dir}\n"
             f"Extracted files ({len(files)}):\n{files_info}"
         )
     elif status == "error":
@@ -287,8 +297,46 @@ def check_download_status(task_id: str) -> str:
         return f"Unknown status: {status}"
 
 
+@functools.lru_cache(maxsize=256)
+def spec_releases(series, number, ttl_bucket):
+    """Group a spec's ZIP version codes by release, oldest first.
+
+    Returns None if the spec directory has no ZIP files. ttl_bucket only varies
+    the cache key, so results expire when the caller's bucket rolls over.
+    """
+    base_url = f"https://www.3gpp.org/ftp/Specs/archive/{series}_series/"
+    doc_url = urljoin(base_url, f"{series}.{number}/")
+
+    # Extract release information from ZIP files in a single pass over the listing
+    prefix = f"{series}{number}-"
+    prefix_len = len(prefix)
+    has_zips = False
+    releases = {}
+    for href in fetch_listing_hrefs(doc_url):
+        if not href.endswith(".zip"):
+            continue
+        has_zips = True
+        filename = href.rpartition("/")[2]
+        if filename.startswith(prefix):
+            version_code = filename[prefix_len:-4]
+            if not version_code.isalnum():
+                continue
+            # The first base-36 digit is the release (e.g., i60 → Rel-18)
+            release_name = f"Rel-{int(version_code[0], 36)}"
+            if release_name not in releases:
+                releases[release_name] = []
+            releases[release_name].append(version_code)
+
+    if not has_zips:
+        return None
+
+    # Codes within a release have the same length, so a plain string sort is
+    # version order. Cached results are shared, so hand out tuples, not lists.
+    return {rel: tuple(sorted(versions)) for rel, versions in releases.items()}
+
+
 @mcp.tool()
-def list_available_specs(spec: str = "", release: str = "") -> str:
+async def list_available_specs(spec: str = "", release: str = "") -> str:
     """
     List available 3GPP specifications and their releases.
 
@@ -308,50 +356,23 @@ def list_available_specs(spec: str = "", release: str = "") -> str:
             doc_dir = f"{series}.{number}"
             doc_url = urljoin(base_url, doc_dir + "/")
 
-            # Checking spec at URL
-
-            r = requests.get(doc_url)
-            r.raise_for_status()
-            soup = BeautifulSoup(r.content, "html.parser")
+            log.debug("Checking spec at URL: %s", doc_url)
 
-            # Get all ZIP files
-            zip_files = []
-            for a in soup.find_all("a", href=True):
-                if isinstance(a, Tag):
-                    href = a.get("href")
-                    if isinstance(href, str) and href.endswith(".zip"):
-                        zip_files.append(href)
-
-            if not zip_files:
+            releases = await asyncio.to_thread(
+                spec_releases, series, number, int(time.time() // LOOKUP_TTL)
+            )
+            if releases is None:
                 return f"❌ Spec {spec} does not exist in the 3GPP archive."
 
-            # Extract release information from ZIP files
-            releases = {}
-            for zip_file in zip_files:
-                filename = os.path.basename(zip_file)
-                if filename.startswith(f"{series}{number}-") and filename.endswith(
-                    ".zip"
-                ):
-                    version_code = filename[len(f"{series}{number}-") : -4]
-                    # Convert version code to release number
-                    try:
-                        version_num = int(version_code, 36)
-                        if version_num < 10:
-                            release_num = version_num
-                        else:
-                            release_num = 10 + (version_num // 100) - 1
-                        release_name = f"Rel-{release_num}"
-                        if release_name not in releases:
-                            releases[release_name] = []
-                        releases[release_name].append(version_code)
-                    except ValueError:
-                        continue
-
             if release:
-                # Check specific release
+                # Check specific release (normalised, e.g. "rel-18" → "Rel-18");
+                # unknown formats keep the caller's string and report not found
+                try:
+                    release = f"Rel-{int(rel_to_zip_suffix(release)[0], 36)}"
+                except ValueError:
+                    pass
                 if release in releases:
                     versions = releases[release]
-                    versions.sort(key=lambda x: int(x, 36))
                     latest_version = versions[-1]
                     return (
                         f"✅ Spec {spec} with {release} is available!\n\n"
@@ -374,7 +395,6 @@ def list_available_specs(spec: str = "", release: str = "") -> str:
                 if releases:
                     releases_info = []
                     for rel, versions in sorted(releases.items()):
-                        versions.sort(key=lambda x: int(x, 36))
                         latest = versions[-1]
                         releases_info.append(
                             f"- {rel}: {len(versions)} versions (latest: {latest})"
@@ -390,37 +410,17 @@ def list_available_specs(spec: str = "", release: str = "") -> str:
                     return f"❌ No valid releases found for {spec}."
 
         else:
-            # List all series and specs
-            all_series = []
-            for series_num in range(20, 40):  # Common 3GPP series
-                series = str(series_num)
-                base_url = f"https://www.3gpp.org/ftp/Specs/archive/{series}_series/"
+            # List all series and specs (probed concurrently)
+            results = await asyncio.gather(
+                *(
+                    asyncio.to_thread(probe_series, str(series_num))
+                    for series_num in range(20, 40)  # Common 3GPP series
+                )
+            )
 
-                try:
-                    r = requests.get(base_url)
-                    r.raise_for_status()
-                    soup = BeautifulSoup(r.content, "html.parser")
-
-                    specs = []
-                    for a in soup.find_all("a", href=True):
-                        if isinstance(a, Tag):
-                            href = a.get("href")
-                            if (
-                                isinstance(href, str)
-                                and href.endswith("/")
-                                and href != "../"
-                            ):
-                                spec_name = href.rstrip("/")
-                                if re.match(r"\d+\.\d+", spec_name):
-                                    specs.append(spec_name)
-
-                    if specs:
-                        all_series.append(f"Series {series}: {len(specs)} specs")
-
-                except requests.exceptions.HTTPError:
-                    continue
-                except Exception:
-                    continue
+            all_series = [
+                f"Series {series}: {count} specs" for series, count in results if count
+            ]
 
             if all_series:
                 series_list = "\n".join(all_series)
@@ -0,0 +1,231 @@
+"""
+Download path tests for threegpp_common
+Runs the ranged, resumed and single-stream ZIP downloads against an in-process
+HTTP server with Range support. Run from the repository root:
+
+    python -m unittest discover tests
+"""
+
+import io
+import os
+import logging
+import re
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import threegpp_common
+
+ZIP_NAME = "38331-z00.zip"
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves server.blob with optional Range support and truncated responses"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def respond(self, head):
+        server = self.server
+        body = server.blob
+        rng = None if server.ignore_range else self.headers.get("Range")
+        if not head:
+            server.ranges.append(self.headers.get("Range"))
+
+        if rng:
+            m = re.match(r"bytes=(\d+)-(\d*)$", rng)
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else len(body) - 1, len(body) - 1)
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            payload = body[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        else:
+            payload = body
+            self.send_response(200)
+        if not server.ignore_range:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if head:
+            return
+
+        # Drop the connection halfway through a range that doesn't start at 0
+        with server.lock:
+            cut = bool(rng) and not rng.startswith("bytes=0-") and server.cuts > 0
+            if cut:
+                server.cuts -= 1
+        if cut:
+            self.wfile.write(payload[: len(payload) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(payload)
+
+
+def make_zip():
+    """Build a stored ZIP (odd size, so ranges don't split evenly) with one document"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+        z.writestr("38331-z00.docx", os.urandom(1_000_003))
+    return buf.getvalue()
+
+
+class DownloadTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        cls.server.daemon_threads = True
+        cls.server.blob = make_zip()
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/{ZIP_NAME}"
+        # Retry warnings are expected here; keep the test output readable
+        logging.getLogger("threegpp_common").setLevel(logging.ERROR)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.ranges = []
+        self.server.cuts = 0
+        self.server.ignore_range = False
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.local_zip = os.path.join(self.output_dir, ZIP_NAME)
+        self.part = self.local_zip + ".part"
+
+        # Range everything, and don't wait out the retry backoff
+        for patcher in (
+            mock.patch.object(threegpp_common, "RANGED_DOWNLOAD_MIN_SIZE", 1),
+            mock.patch.object(threegpp_common.time, "sleep"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def bounds(self):
+        size, n = len(self.server.blob), threegpp_common.DOWNLOAD_CONNECTIONS
+        return [size * i // n for i in range(n + 1)]
+
+    def test_ranged_download_covers_every_byte_once(self):
+        threegpp_common.download_zip(self.url, self.output_dir)
+
+        self.assertEqual(self.read(self.local_zip), self.server.blob)
+        self.assertFalse(os.path.exists(self.part))
+        bounds = self.bounds()
+        expected = [f"bytes={s}-{e - 1}" for s, e in zip(bounds, bounds[1:])]
+        self.assertEqual(sorted(self.server.ranges), sorted(expected))
+
+    def test_truncated_range_resumes_after_written_bytes(self):
+        self.server.cuts = 1
+
+        threegpp_common.download_zip(self.url, self.output_dir)
+
+        self.assertEqual(self.read(self.local_zip), self.server.blob)
+        starts = {
+            int(re.match(r"bytes=(\d+)-", r).group(1)) for r in self.server.ranges
+        }
+        # One retry asked for the rest of its range rather than starting it again
+        self.assertEqual(
+            len(self.server.ranges), threegpp_common.DOWNLOAD_CONNECTIONS + 1
+        )
+        self.assertTrue(starts - set(self.bounds()))
+
+    def test_failed_ranges_keep_contiguous_head_for_resume(self):
+        self.server.cuts = 100
+        with mock.patch.object(threegpp_common, "DOWNLOAD_ATTEMPTS", 2):
+            with self.assertRaises(threegpp_common.TRANSIENT_DOWNLOAD_ERRORS):
+                threegpp_common.download_zip(self.url, self.output_dir)
+
+        self.assertFalse(os.path.exists(self.local_zip))
+        head = self.read(self.part)
+        self.assertGreaterEqual(len(head), self.bounds()[1])  # range 0 is never cut
+        self.assertLess(len(head), len(self.server.blob))
+        self.assertEqual(head, self.server.blob[: len(head)])
+
+        # The next call resumes the kept head over a single stream
+        self.server.cuts = 0
+        self.server.ranges = []
+        threegpp_common.download_zip(self.url, self.output_dir)
+
+        self.assertEqual(self.server.ranges, [f"bytes={len(head)}-"])
+        self.assertEqual(self.read(self.local_zip), self.server.blob)
+        self.assertFalse(os.path.exists(self.part))
+
+    def test_stream_starts_over_when_range_is_ignored(self):
+        self.server.ignore_range = True
+        with open(self.part, "wb") as f:
+            f.write(b"stale" * 100)
+
+        threegpp_common.download_zip(self.url, self.output_dir)
+
+        self.assertEqual(self.read(self.local_zip), self.server.blob)
+        self.assertEqual(self.server.ranges, ["bytes=500-"])
+
+    def test_stream_starts_over_after_416(self):
+        with open(self.part, "wb") as f:
+            f.write(b"\0" * (len(self.server.blob) + 10))
+
+        threegpp_common.download_zip(self.url, self.output_dir)
+
+        self.assertEqual(self.read(self.local_zip), self.server.blob)
+        self.assertEqual(
+            self.server.ranges, [f"bytes={len(self.server.blob) + 10}-", None]
+        )
+
+    def test_concurrent_downloads_of_the_same_zip(self):
+        errors = []
+
+        def download(keep_zip):
+            try:
+                threegpp_common.download_and_extract(
+                    self.url, self.output_dir, keep_zip
+                )
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=download, args=(keep_zip,))
+            for keep_zip in (False, True, True)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertFalse(os.path.exists(self.part))
+        with zipfile.ZipFile(io.BytesIO(self.server.blob)) as z:
+            expected = z.read("38331-z00.docx")
+        self.assertEqual(
+            self.read(os.path.join(self.output_dir, "38331-z00.docx")), expected
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
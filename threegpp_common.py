@@ -0,0 +1,544 @@
+"""
+3GPP Document Downloader common helpers
+Spec/release parsing, archive lookup and ZIP download/extraction shared by
+the CLI (3gpp_downloader.py) and the FastMCP server (mcp_server.py).
+"""
+
+import os
+import re
+import functools
+import time
+import shutil
+import threading
+import logging
+import zipfile
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+log = logging.getLogger(__name__)
+
+# Read size for streaming ZIP downloads and member extraction (1 MiB)
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Parallel Range connections per ZIP download, and the smallest file worth splitting
+DOWNLOAD_CONNECTIONS = 4
+RANGED_DOWNLOAD_MIN_SIZE = 8 << 20
+
+# Threads inflating ZIP members in parallel (each opens its own ZipFile handle)
+EXTRACT_WORKERS = 8
+
+# Single-stream download attempts, each resuming from the partial ".part" file
+DOWNLOAD_ATTEMPTS = 5
+
+# Errors that leave a partial download worth resuming
+TRANSIENT_DOWNLOAD_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    urllib3.exceptions.HTTPError,
+)
+
+# Spec numbers (e.g., "TS 38.101-1") and release names (e.g., "Rel-18")
+_SPEC_RE = re.compile(r"(TS|TR|GS|GR)\s*(\d{2})\.(\d{3})(?:-(\d+))?")
+_REL_RE = re.compile(r"Rel-(\d+)", re.I)
+
+# Spec directory names in a series listing (e.g., "38.331")
+_SPEC_DIR_RE = re.compile(r"\d+\.\d+")
+
+# Anchor hrefs in a 3GPP archive listing (scanned directly, no HTML DOM)
+_HREF_RE = re.compile(rb"""<a\s[^>]*?href\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+# Shared HTTP session so calls to 3gpp.org reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            # Throttling and transient server errors are retried like dropped connections
+            status_forcelist=(429, 500, 502, 503, 504),
+        ),
+    ),
+)
+# Listings are plain HTML, so always negotiate compression (urllib3 decodes it)
+SESSION.headers.update(
+    {"User-Agent": "3gpp-downloader/1.0", "Accept-Encoding": "gzip, deflate"}
+)
+
+# Seconds a cached directory listing is reused before it is revalidated
+LISTING_TTL = 60
+
+# Directory listing cache: url -> (etag, last_modified, fetched_at, hrefs)
+LISTING_CACHE = {}
+
+# Seconds a parsed spec lookup (latest ZIP, releases) is reused without a fetch
+LOOKUP_TTL = 600
+
+# Per-file locks so only one download in this process owns a given ZIP/".part"
+_ZIP_LOCKS = {}
+_ZIP_LOCKS_GUARD = threading.Lock()
+
+
+@functools.lru_cache(maxsize=256)
+def parse_spec_number(spec: str):
+    m = _SPEC_RE.match(spec.upper())
+    if not m:
+        raise ValueError("Invalid spec format. Example: TS 24.301, TR 38.101-1")
+    spec_type, series, number, sub = m.groups()
+    return series, number, sub or "1"
+
+
+# Release name → ZIP version prefix, base-36: 0-9 as is, 10-35 as a-z
+# (e.g., REL-8 → 800, REL-18 → i00)
+_REL_SUFFIX = {
+    f"REL-{n}": f"{'0123456789abcdefghijklmnopqrstuvwxyz'[n]}00" for n in range(36)
+}
+
+
+def rel_to_zip_suffix(rel: str):
+    # Convert release number to base-36 (e.g., Rel-18 → i)
+    suffix = _REL_SUFFIX.get(rel.upper())
+    if suffix is not None:
+        return suffix
+
+    # Less common spellings (e.g., "Rel-018") and invalid input are parsed
+    m = _REL_RE.match(rel)
+    if not m:
+        raise ValueError("Invalid release format. Example: Rel-18")
+
+    rel_num = int(m.group(1))
+    if rel_num < 36:
+        return _REL_SUFFIX[f"REL-{rel_num}"]
+    else:
+        raise ValueError(f"Unsupported release number: {rel_num}")
+
+
+def fetch_listing_hrefs(url):
+    """Return the anchor hrefs of a 3GPP archive listing, using a conditional GET cache"""
+    cached = LISTING_CACHE.get(url)
+    if cached and time.time() - cached[2] < LISTING_TTL:
+        return cached[3]
+
+    headers = {}
+    if cached:
+        etag, last_modified, _, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    r = SESSION.get(url, headers=headers)
+    if cached and r.status_code == 304:
+        # Listing unchanged: keep the cached hrefs and skip rescanning the body
+        etag, last_modified, _, hrefs = cached
+        etag = r.headers.get("ETag", etag)
+        last_modified = r.headers.get("Last-Modified", last_modified)
+    else:
+        r.raise_for_status()
+        hrefs = [h.decode("utf-8", "replace") for h in _HREF_RE.findall(r.content)]
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+
+    LISTING_CACHE[url] = (etag, last_modified, time.time(), hrefs)
+    return hrefs
+
+
+def find_spec_zip_link(series, number, rel_suffix):
+    """Return the latest ZIP URL for a spec release, reusing lookups for LOOKUP_TTL seconds"""
+    return _find_spec_zip_link_cached(
+        series, number, rel_suffix, int(time.time() // LOOKUP_TTL)
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _find_spec_zip_link_cached(series, number, rel_suffix, ttl_bucket):
+    # ttl_bucket only varies the cache key, so entries expire when the bucket rolls over
+    base_url = f"https://www.3gpp.org/ftp/Specs/archive/{series}_series/"
+    doc_dir = f"{series}.{number}"
+    doc_url = urljoin(base_url, doc_dir + "/")
+
+    log.debug("Search URL: %s", doc_url)
+    log.debug("Looking for release suffix: %s", rel_suffix)
+
+    all_zips = [href for href in fetch_listing_hrefs(doc_url) if href.endswith(".zip")]
+
+    # Find ZIP files starting with the release suffix and keep the latest version
+    # (largest base-36 value) in the same pass. The filename pattern is compiled
+    # once per lookup and captures the version code (e.g., 38331-i60.zip → i60).
+    version_re = re.compile(
+        r"(?:^|/)" + re.escape(f"{series}{number}-") + r"([0-9a-z]+)\.zip$"
+    )
+    best_version, latest = -1, None
+    for href in all_zips:
+        m = version_re.search(href)
+        if m and m.group(1).startswith(rel_suffix[:1]):  # first char matches release
+            version_code = m.group(1)
+            log.debug(
+                "Release candidate ZIP: %s (version code: %s)", href, version_code
+            )
+            version = int(version_code, 36)
+            if version > best_version:
+                best_version, latest = version, href
+
+    if latest is None:
+        log.warning("No ZIP file found starting with release %s", rel_suffix[:1])
+        log.info("Available ZIP files: %s...", all_zips[:10])  # Show first 10 only
+        return None
+
+    log.info("Latest ZIP: %s", latest)
+    return urljoin(doc_url, latest)
+
+
+def probe_series(series):
+    """Count the spec directories under one series; returns (series, count or None)"""
+    base_url = f"https://www.3gpp.org/ftp/Specs/archive/{series}_series/"
+
+    try:
+        # Spec directories end in "/" and are named like "38.331" (hrefs may be absolute)
+        specs = [
+            href
+            for href in fetch_listing_hrefs(base_url)
+            if href.endswith("/")
+            and _SPEC_DIR_RE.match(href.rstrip("/").rpartition("/")[2])
+        ]
+
+        return series, len(specs)
+
+    except requests.exceptions.HTTPError:
+        return series, None
+    except Exception:
+        return series, None
+
+
+class DownloadProgress:
+    """Thread-safe byte counter for a ZIP download; report() decides where messages go"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start(0)
+
+    def start(self, total_size, downloaded_size=0):
+        """Reset the counter for a (possibly resumed) transfer of total_size bytes"""
+        with self.lock:
+            self.total_size = total_size
+            self.downloaded_size = downloaded_size
+            # Report every 10%, but never more often than once per MiB
+            self.report_every = max(total_size // 10, 1 << 20)
+            self.next_report = downloaded_size + self.report_every
+
+    def update(self, n):
+        with self.lock:
+            self.downloaded_size += n
+            if self.downloaded_size < self.next_report:
+                return
+            self.next_report += self.report_every
+
+            # Format and report under the lock so parallel range writers can't
+            # publish an older percentage after a newer one
+            mb = self.downloaded_size / (1024 * 1024)
+            if self.total_size > 0:
+                progress = (self.downloaded_size / self.total_size) * 100
+                message = f"Download progress: {progress:.1f}% ({mb:.1f} MB / {self.total_size / (1024*1024):.1f} MB)"
+            else:
+                message = f"Download progress: {mb:.1f} MB"
+            self.report(message)
+
+    def report(self, message):
+        log.info(message)
+
+
+class ProgressWriter:
+    """File wrapper that reports every write to a DownloadProgress"""
+
+    def __init__(self, f, progress):
+        self.f = f
+        self.progress = progress
+
+    def write(self, chunk):
+        self.f.write(chunk)
+        self.progress.update(len(chunk))
+
+
+def preallocate(f, size):
+    """Reserve size bytes for f up front, falling back to extending it with truncate()"""
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        # No posix_fallocate (Windows/macOS) or unsupported by the filesystem
+        f.truncate(size)
+
+
+def download_stream(zip_url, local_zip, progress):
+    """Download zip_url into local_zip over a single connection.
+
+    Bytes go to a ".part" file first. A failed attempt is retried with
+    exponential backoff and resumes from the end of that file with a Range request.
+    """
+    part = local_zip + ".part"
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        existing = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Accept-Encoding": "identity"}
+        if existing:
+            headers["Range"] = f"bytes={existing}-"
+
+        try:
+            with SESSION.get(zip_url, headers=headers, stream=True, timeout=600) as r:
+                if r.status_code == 416:
+                    # Partial file no longer matches the remote ZIP: start over
+                    os.remove(part)
+                    continue
+                r.raise_for_status()
+                if r.status_code != 206:
+                    # Server ignored the Range header: truncate and start over
+                    existing = 0
+                else:
+                    log.info("Resuming download at byte %d", existing)
+                total_size = existing + int(r.headers.get("content-length", 0))
+                progress.start(total_size, existing)
+
+                # Not preallocated: the ".part" size is the resume offset, and it
+                # must stay accurate even if the process is killed mid-transfer
+                with open(part, "ab" if existing else "wb") as f:
+                    r.raw.decode_content = True
+                    shutil.copyfileobj(
+                        r.raw, ProgressWriter(f, progress), DOWNLOAD_CHUNK_SIZE
+                    )
+                    written = f.tell()
+
+            if written < total_size:
+                raise requests.exceptions.ConnectionError(
+                    f"Connection closed after {written} of {total_size} bytes"
+                )
+            os.replace(part, local_zip)
+            return
+
+        except TRANSIENT_DOWNLOAD_ERRORS as e:
+            if attempt == DOWNLOAD_ATTEMPTS - 1:
+                raise
+            log.warning("Download interrupted (%s), retrying...", e)
+            time.sleep(2**attempt)
+
+    raise IOError(f"Download failed after {DOWNLOAD_ATTEMPTS} attempts: {zip_url}")
+
+
+def download_range(zip_url, part, start, end, progress, reached):
+    """Fetch bytes [start, end) of zip_url into the same offsets of part.
+
+    A dropped connection is retried with exponential backoff and resumes after
+    the bytes already written; reached[start] tracks how far the range got.
+    Returns False if the server ignored the Range header.
+    """
+    pos = start
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        headers = {"Range": f"bytes={pos}-{end - 1}", "Accept-Encoding": "identity"}
+        try:
+            with SESSION.get(zip_url, headers=headers, stream=True, timeout=600) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    return False
+
+                with open(part, "r+b") as f:
+                    f.seek(pos)
+                    try:
+                        shutil.copyfileobj(
+                            r.raw, ProgressWriter(f, progress), DOWNLOAD_CHUNK_SIZE
+                        )
+                    finally:
+                        pos = reached[start] = f.tell()
+
+            if pos > end:
+                raise IOError(f"Range {start}-{end - 1} overran to byte {pos}")
+            if pos < end:
+                raise requests.exceptions.ConnectionError(
+                    f"Range {start}-{end - 1} closed after {pos - start} bytes"
+                )
+            return True
+
+        except TRANSIENT_DOWNLOAD_ERRORS as e:
+            if attempt == DOWNLOAD_ATTEMPTS - 1:
+                raise
+            log.warning("Range %d-%d interrupted (%s), retrying...", start, end - 1, e)
+            time.sleep(2**attempt)
+
+    raise IOError(f"Range {start}-{end - 1} failed after {DOWNLOAD_ATTEMPTS} attempts")
+
+
+def download_ranged(zip_url, local_zip, progress):
+    """Download zip_url with parallel Range requests.
+
+    Ranges are written into a preallocated ".part" file that only replaces
+    local_zip once every range has completed. If a range keeps failing, the
+    ".part" file is cut back to its contiguous downloaded head so download_stream
+    can resume it. Returns False, leaving nothing on disk, if the server does not
+    support ranges or the file is too small to be worth splitting.
+    """
+    head = SESSION.head(
+        zip_url,
+        headers={"Accept-Encoding": "identity"},
+        allow_redirects=True,
+        timeout=30,
+    )
+    total_size = int(head.headers.get("content-length", 0))
+    if (
+        not head.ok
+        or head.headers.get("accept-ranges", "").lower() != "bytes"
+        or total_size < RANGED_DOWNLOAD_MIN_SIZE
+    ):
+        return False
+
+    log.info(
+        "Downloading %d bytes over %d connections", total_size, DOWNLOAD_CONNECTIONS
+    )
+    part = local_zip + ".part"
+    progress.start(total_size)
+    with open(part, "wb") as f:
+        preallocate(f, total_size)
+
+    # Split [0, total_size) into one half-open interval per connection
+    bounds = [
+        total_size * i // DOWNLOAD_CONNECTIONS for i in range(DOWNLOAD_CONNECTIONS + 1)
+    ]
+    ranges = list(zip(bounds, bounds[1:]))
+    reached = {}  # range start -> first byte not yet written
+    try:
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_CONNECTIONS) as ex:
+            futures = [
+                ex.submit(download_range, zip_url, part, start, end, progress, reached)
+                for start, end in ranges
+            ]
+            ranged = all([future.result() for future in futures])
+    except TRANSIENT_DOWNLOAD_ERRORS:
+        # Keep the bytes that are contiguous from offset 0 and drop the rest
+        head_size = 0
+        for start, end in ranges:
+            head_size = reached.get(start, start)
+            if head_size < end:
+                break
+        with open(part, "r+b") as f:
+            f.truncate(head_size)
+        raise
+    except Exception:
+        os.remove(part)
+        raise
+
+    if not ranged:
+        # Server answered 200 to a Range request: fall back to a single stream
+        os.remove(part)
+        progress.start(0)
+        return False
+
+    os.replace(part, local_zip)
+    return True
+
+
+def local_zip_path(zip_url, output_dir):
+    """Return where zip_url is saved in output_dir"""
+    # Last path segment of the URL, ignoring any query string
+    return os.path.join(output_dir, zip_url.split("?", 1)[0].rpartition("/")[2])
+
+
+def zip_lock(local_zip):
+    """Return the lock serialising downloads (and extraction/removal) of local_zip"""
+    key = os.path.realpath(local_zip)
+    with _ZIP_LOCKS_GUARD:
+        return _ZIP_LOCKS.setdefault(key, threading.Lock())
+
+
+def download_zip(zip_url, output_dir, progress=None):
+    """Download zip_url into output_dir and return the local ZIP path.
+
+    The caller must hold zip_lock() for the path, so a ".part" file found here
+    belongs to an interrupted download rather than one still running.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    local_zip = local_zip_path(zip_url, output_dir)
+    if progress is None:
+        progress = DownloadProgress()
+
+    # An interrupted single-stream download is resumed rather than restarted
+    if os.path.exists(local_zip + ".part") or not download_ranged(
+        zip_url, local_zip, progress
+    ):
+        download_stream(zip_url, local_zip, progress)
+    return local_zip
+
+
+# Characters ZipFile.extract replaces with "_" in member names on Windows
+_WINDOWS_ILLEGAL = str.maketrans(':<>|"?*', "_______")
+
+
+def member_target(info, output_dir):
+    """Return where a ZIP member lands in output_dir, sanitising it like ZipFile.extract"""
+    # Drop drive letters, absolute roots and "." / ".." components
+    arcname = info.filename.replace("/", os.sep)
+    if os.altsep:
+        arcname = arcname.replace(os.altsep, os.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [p for p in arcname.split(os.sep) if p not in ("", os.curdir, os.pardir)]
+    if os.sep == "\\":
+        # Windows: replace illegal characters and drop trailing dots/spaces
+        parts = [p.translate(_WINDOWS_ILLEGAL).rstrip(". ") for p in parts]
+        parts = [p for p in parts if p]
+    return os.path.join(output_dir, *parts)
+
+
+def extract_member(z, info, target):
+    """Stream one ZIP member to target"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with z.open(info) as src, open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+
+
+def extract_batch(local_zip, members):
+    """Extract (info, target) pairs through a ZipFile handle private to this thread"""
+    with zipfile.ZipFile(local_zip, "r") as z:
+        for info, target in members:
+            extract_member(z, info, target)
+            log.info("Extracted: %s", info.filename)
+
+
+def extract_documents(local_zip, output_dir):
+    """Extract the PDF/DOC/DOCX members of local_zip and return their names"""
+    # Members that sanitise to the same file (e.g., "a.pdf" and "./a.pdf") would
+    # race in different workers; keep only the last one, as sequential extract would
+    members = {}
+    with zipfile.ZipFile(local_zip, "r") as z:
+        for info in z.infolist():
+            if info.filename.lower().endswith((".pdf", ".doc", ".docx")):
+                target = member_target(info, output_dir)
+                members.pop(os.path.normcase(target), None)
+                members[os.path.normcase(target)] = (info, target)
+    members = list(members.values())
+
+    # ZipFile handles are not safe to share between threads, so split the members
+    # round-robin and give every worker its own handle
+    workers = min(EXTRACT_WORKERS, len(members))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = [
+                ex.submit(extract_batch, local_zip, members[i::workers])
+                for i in range(workers)
+            ]
+            for future in futures:
+                future.result()
+    elif members:
+        extract_batch(local_zip, members)
+    return [info.filename for info, _ in members]
+
+
+def download_and_extract(zip_url, output_dir, keep_zip=True):
+    """Download zip_url and extract its documents; returns the extracted names"""
+    with zip_lock(local_zip_path(zip_url, output_dir)):
+        local_zip = download_zip(zip_url, output_dir)
+        extracted_files = extract_documents(local_zip, output_dir)
+        if not keep_zip:
+            os.remove(local_zip)
+    log.info("Download and extraction complete: %s", local_zip)
+    return extracted_files